@@ -1,20 +1,136 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Header, Request, Response
 from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Optional
 from datetime import datetime, timedelta
+import functools
 import logging
-from app.models.cv import CV
+import threading
+from app.models.cv import CV, JobMatchRequest
 from app.services.cv_parser import parse_cv
 from app.services.cv_analyzer import cv_analyzer
-from app.core.supabase import supabase
+from app.services.cv_search import cv_search_index
+from app.services.cv_matching import cv_matcher
+from app.core.supabase import supabase, fetch_all_rows, fetch_rows_by_ids
+from app.core.etag import compute_etag, etag_matches
+from app.core.shared_cache import shared_cache
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/cv", tags=["cv"])
 
+# Versione della cache condivisa fino alla quale gli indici di questo worker sono aggiornati
+_indexes_version = None
+# Versioni generate dalle scritture di questo worker (gia' applicate agli indici)
+_own_versions = set()
+# Oltre questa soglia le versioni proprie vengono consumate applicando subito gli eventi
+MAX_OWN_VERSIONS = 1000
+# Le funzioni che seguono bloccano (lock degli indici, database): vanno chiamate con run_in_threadpool
+_indexes_lock = threading.Lock()
+
+def _sync_indexes(profile: dict):
+    """
+    Propaga un CV inserito o modificato agli indici in memoria e agli altri worker.
+    Viene chiamata dopo che la scrittura sul database e' andata a buon fine, quindi
+    non solleva eccezioni: in caso di errore gli indici locali vengono scartati.
+    """
+    try:
+        cv_search_index.upsert(profile)
+        cv_matcher.upsert(profile)
+        _record_own_version(shared_cache.invalidate({"op": "upsert", "id": str(profile["id"])}))
+    except Exception as e:
+        _discard_indexes(e)
+
+def _drop_from_indexes(cv_id: str):
+    """Come _sync_indexes, per un CV eliminato."""
+    try:
+        cv_search_index.remove(cv_id)
+        cv_matcher.remove(cv_id)
+        _record_own_version(shared_cache.invalidate({"op": "delete", "id": str(cv_id)}))
+    except Exception as e:
+        _discard_indexes(e)
+
+def _discard_indexes(error: Exception):
+    # Gli indici potrebbero non riflettere la scrittura: verranno ricostruiti dal database
+    logger.error(f"Errore durante l'aggiornamento degli indici: {str(error)}")
+    cv_search_index.invalidate()
+    cv_matcher.invalidate()
+
+def _record_own_version(version: int):
+    """Ricorda una versione generata da questo worker, da non riapplicare agli indici."""
+    global _indexes_version
+    with _indexes_lock:
+        if _indexes_version is None:
+            # Indici mai sincronizzati: il primo refresh li ricostruisce comunque
+            return
+        if version == _indexes_version + 1:
+            # Nessuna scrittura di altri worker nel mezzo: gli indici sono gia' aggiornati
+            _indexes_version = version
+            return
+        _own_versions.add(version)
+        if len(_own_versions) > MAX_OWN_VERSIONS:
+            _apply_foreign_events()
+
+def _refresh_indexes():
+    """Applica agli indici locali le scritture fatte dagli altri worker."""
+    with _indexes_lock:
+        _apply_foreign_events()
+
+def _apply_foreign_events():
+    global _indexes_version, _own_versions
+    version = shared_cache.version()
+    if version == _indexes_version:
+        return
+
+    events = None if _indexes_version is None else shared_cache.events_since(_indexes_version)
+    if events is None:
+        # Log non disponibile: gli indici verranno ricostruiti alla prossima ricerca
+        cv_search_index.invalidate()
+        cv_matcher.invalidate()
+    else:
+        foreign = [e for e in events if e["version"] not in _own_versions]
+        deleted = {e["id"] for e in foreign if e.get("op") == "delete"}
+        updated = {e["id"] for e in foreign if e.get("op") == "upsert"} - deleted
+        for cv_id in deleted:
+            cv_search_index.remove(cv_id)
+            cv_matcher.remove(cv_id)
+        if updated:
+            for row in fetch_rows_by_ids('cv_profiles', list(updated)):
+                cv_search_index.upsert(row)
+                cv_matcher.upsert(row)
+        if events:
+            version = max(version, events[-1]["version"])
+
+    _own_versions = {v for v in _own_versions if v > version}
+    _indexes_version = version
+
+def _shared_cached(key: str):
+    """Serve la risposta dalla cache condivisa tra i worker finché nessuno scrive sui CV."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            version = shared_cache.version()
+            cached = shared_cache.get(key)
+            if cached is not None:
+                return cached
+            return shared_cache.set(key, await func(*args, **kwargs), version)
+        return wrapper
+    return decorator
+
+def _conditional_response(payload, if_none_match: Optional[str], response: Response):
+    """Imposta l'ETag della risposta e restituisce 304 se il client ha gia' questa versione."""
+    etag = compute_etag(payload)
+    if etag_matches(if_none_match, etag, weak=True):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return payload
+
 @router.get("")
 async def get_cvs(
+    request: Request,
+    response: Response,
+
     # Paginazione
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=5000),
@@ -49,85 +165,130 @@ async def get_cvs(
     data_al: Optional[datetime] = None,
     created_at_dal: Optional[datetime] = None,
     created_at_al: Optional[datetime] = None,
+
+    # Richieste condizionali
+    if_none_match: Optional[str] = Header(None),
 ):
     try:
+        # Listing identici vengono serviti dalla cache condivisa tra i worker
+        cache_version = shared_cache.version()
+        cache_key = f"cvs:{sorted(request.query_params.multi_items())}"
+        cached = shared_cache.get(cache_key)
+        if cached is not None:
+            return _conditional_response(cached, if_none_match, response)
+
         print("Backend received date:", created_at_dal)
+        # In modalità "match" i filtri su skill, esperienza e RAL desiderata
+        # non escludono i CV ma diventano criteri di punteggio
+        match_mode = sort_by == 'match'
+
         # Query base per il conteggio totale senza filtri
         total_query = supabase.from_('cv_profiles').select('*', count='exact')
         total_count = total_query.execute().count
 
-        # Query per i dati filtrati
-        query = supabase.from_('cv_profiles').select('*', count='exact')
-        
-        # Applica tutti i filtri
-        if search:
-            search_safe = search.replace('%', r'\%').replace('_', r'\_')
-            query = query.or_(
-                f"nome.ilike.%{search_safe}%,"
-                f"cognome.ilike.%{search_safe}%,"
-                f"competenze.ilike.%{search_safe}%"
-            )
-        
-        if nome:
-            nome_safe = nome.replace('%', r'\%').replace('_', r'\_')
-            query = query.ilike('nome', f"%{nome_safe}%")
-        if cognome:
-            cognome_safe = cognome.replace('%', r'\%').replace('_', r'\_')
-            query = query.ilike('cognome', f"%{cognome_safe}%")
-        if citta:
-            query = query.in_('citta', citta)
+        def apply_filters(query):
+            """Applica a una query su cv_profiles tutti i filtri della richiesta."""
+            if search:
+                search_safe = search.replace('%', r'\%').replace('_', r'\_')
+                query = query.or_(
+                    f"nome.ilike.%{search_safe}%,"
+                    f"cognome.ilike.%{search_safe}%,"
+                    f"competenze.ilike.%{search_safe}%"
+                )
+        
+            if nome:
+                nome_safe = nome.replace('%', r'\%').replace('_', r'\_')
+                query = query.ilike('nome', f"%{nome_safe}%")
+            if cognome:
+                cognome_safe = cognome.replace('%', r'\%').replace('_', r'\_')
+                query = query.ilike('cognome', f"%{cognome_safe}%")
+            if citta:
+                query = query.in_('citta', citta)
             
-        # Filtri numerici
-        if anni_esperienza_min is not None:
-            query = query.gte('anni_esperienza', anni_esperienza_min)
-        if anni_esperienza_max is not None:
-            query = query.lte('anni_esperienza', anni_esperienza_max)
+            # Filtri numerici
+            if anni_esperienza_min is not None and not match_mode:
+                query = query.gte('anni_esperienza', anni_esperienza_min)
+            if anni_esperienza_max is not None and not match_mode:
+                query = query.lte('anni_esperienza', anni_esperienza_max)
             
-        # Aggiungiamo i filtri per RAL attuale
-        if stipendio_attuale_min is not None:
-            query = query.gte('stipendio_attuale', stipendio_attuale_min)
-        if stipendio_attuale_max is not None:
-            query = query.lte('stipendio_attuale', stipendio_attuale_max)
+            # Aggiungiamo i filtri per RAL attuale
+            if stipendio_attuale_min is not None:
+                query = query.gte('stipendio_attuale', stipendio_attuale_min)
+            if stipendio_attuale_max is not None:
+                query = query.lte('stipendio_attuale', stipendio_attuale_max)
             
-        # Aggiungiamo i filtri per RAL desiderata
-        if stipendio_desiderato_min is not None:
-            query = query.gte('stipendio_desiderato', stipendio_desiderato_min)
-        if stipendio_desiderato_max is not None:
-            query = query.lte('stipendio_desiderato', stipendio_desiderato_max)
+            # Aggiungiamo i filtri per RAL desiderata
+            if stipendio_desiderato_min is not None and not match_mode:
+                query = query.gte('stipendio_desiderato', stipendio_desiderato_min)
+            if stipendio_desiderato_max is not None and not match_mode:
+                query = query.lte('stipendio_desiderato', stipendio_desiderato_max)
             
-        # Filtri array
-        if tools:
-            print("\n=== TOOLS FILTER DEBUG ===")
-            print(f"Received tools: {tools}")
-            # Se tools è una stringa, convertiamola in lista
-            if isinstance(tools, str):
-                tools = [tools]
-            query = query.contains('tools', tools)
+            # Filtri array
+            if tools and not match_mode:
+                print("\n=== TOOLS FILTER DEBUG ===")
+                print(f"Received tools: {tools}")
+                # Se tools è una stringa, convertiamola in lista
+                query = query.contains('tools', [tools] if isinstance(tools, str) else tools)
             
-        if database:
-            query = query.contains('database', database)
-        if piattaforme:
-            query = query.contains('piattaforme', piattaforme)
-        if sistemi_operativi:
-            query = query.contains('sistemi_operativi', sistemi_operativi)
-        if linguaggi:
-            query = query.contains('linguaggi_programmazione', linguaggi)
+            if database and not match_mode:
+                query = query.contains('database', database)
+            if piattaforme and not match_mode:
+                query = query.contains('piattaforme', piattaforme)
+            if sistemi_operativi and not match_mode:
+                query = query.contains('sistemi_operativi', sistemi_operativi)
+            if linguaggi and not match_mode:
+                query = query.contains('linguaggi_programmazione', linguaggi)
             
-        # Date - ultimo contatto
-        if data_dal:
-            query = query.gte('ultimo_contatto', f"{data_dal.date()}T00:00:00")
-        if data_al:
-            query = query.lte('ultimo_contatto', f"{data_al.date()}T23:59:59")
+            # Date - ultimo contatto
+            if data_dal:
+                query = query.gte('ultimo_contatto', f"{data_dal.date()}T00:00:00")
+            if data_al:
+                query = query.lte('ultimo_contatto', f"{data_al.date()}T23:59:59")
             
-        # Date - created_at
-        if created_at_dal:
-            print("\n=== DATE FILTER DEBUG ===")
-            print(f"Received date: {created_at_dal}")
-            query = query.filter('created_at', 'gte', created_at_dal)
-            print("Query:", query._compiler().get_sql())
-        if created_at_al:
-            query = query.filter('created_at', 'lte', created_at_al)
+            # Date - created_at
+            if created_at_dal:
+                print("\n=== DATE FILTER DEBUG ===")
+                print(f"Received date: {created_at_dal}")
+                query = query.filter('created_at', 'gte', created_at_dal)
+                print("Query:", query._compiler().get_sql())
+            if created_at_al:
+                query = query.filter('created_at', 'lte', created_at_al)
+            return query
+
+        # Query per i dati filtrati
+        query = apply_filters(supabase.from_('cv_profiles').select('*', count='exact'))
             
+        if match_mode:
+            # Senza altri filtri il punteggio viene calcolato su tutti i CV indicizzati,
+            # altrimenti solo su quelli che superano i filtri applicati alla query
+            has_other_filters = any(
+                value is not None for value in (
+                    search, nome, cognome, citta,
+                    stipendio_attuale_min, stipendio_attuale_max,
+                    data_dal, data_al, created_at_dal, created_at_al,
+                )
+            )
+            candidate_ids = None
+            if has_other_filters:
+                # Solo gli id, a pagine: PostgREST limita il numero di righe per risposta
+                candidate_ids = [row['id'] for row in fetch_all_rows('cv_profiles', 'id', filters=apply_filters)]
+
+            skills = {
+                'tools': tools,
+                'database': database,
+                'piattaforme': piattaforme,
+                'sistemi_operativi': sistemi_operativi,
+                'linguaggi_programmazione': linguaggi,
+            }
+            ranges = {
+                'anni_esperienza': (anni_esperienza_min, anni_esperienza_max),
+                'stipendio_desiderato': (stipendio_desiderato_min, stipendio_desiderato_max),
+            }
+            await run_in_threadpool(_refresh_indexes)
+            payload = await _get_cvs_by_match(skills, ranges, candidate_ids, page, page_size, total_count)
+            shared_cache.set(cache_key, payload, cache_version)
+            return _conditional_response(payload, if_none_match, response)
+
         # Ordinamento
         valid_sort_fields = ['nome', 'cognome', 'created_at', 'anni_esperienza']
         if sort_by and sort_by in valid_sort_fields:
@@ -150,13 +311,14 @@ async def get_cvs(
         
         # Se non ci sono risultati, restituisci una lista vuota senza fare la query
         if filtered_count == 0:
-            return {
+            payload = shared_cache.set(cache_key, {
                 "items": [],
                 "total": total_count,
                 "filtered_total": 0,
                 "page": 1,
                 "page_size": page_size
-            }
+            }, cache_version)
+            return _conditional_response(payload, if_none_match, response)
 
         # Applica la paginazione solo se ci sono risultati
         if end >= start:
@@ -164,18 +326,56 @@ async def get_cvs(
         else:
             paged_result = {"data": []}
         
-        return {
+        payload = shared_cache.set(cache_key, {
             "items": paged_result.data,
             "total": total_count,
             "filtered_total": filtered_count,
             "page": page,
             "page_size": page_size
-        }
+        }, cache_version)
+        return _conditional_response(payload, if_none_match, response)
         
     except Exception as e:
         logging.error(f"Error in get_cvs: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _get_cvs_by_match(skills, ranges, candidate_ids, page, page_size, total_count):
+    """Pagina i CV ordinati per punteggio di corrispondenza parziale (sort_by=match)."""
+    start = (page - 1) * page_size
+    filtered_count, matches = await run_in_threadpool(
+        cv_matcher.rank, skills, ranges, candidate_ids, start, page_size
+    )
+
+    # Se la pagina richiesta non esiste, restituisci l'ultima disponibile
+    total_pages = (filtered_count + page_size - 1) // page_size
+    if page > total_pages and total_pages > 0:
+        page = total_pages
+        start = (page - 1) * page_size
+        filtered_count, matches = await run_in_threadpool(
+            cv_matcher.rank, skills, ranges, candidate_ids, start, page_size
+        )
+
+    if not matches:
+        return {
+            "items": [],
+            "total": total_count,
+            "filtered_total": filtered_count,
+            "page": page if filtered_count else 1,
+            "page_size": page_size
+        }
+
+    scores = dict(matches)
+    items = [dict(row, match_score=scores[str(row['id'])]) for row in fetch_rows_by_ids('cv_profiles', list(scores))]
+    items.sort(key=lambda row: row['match_score'], reverse=True)
+
+    return {
+        "items": items,
+        "total": total_count,
+        "filtered_total": filtered_count,
+        "page": page,
+        "page_size": page_size
+    }
+
 def convert_date_format(date_str: str) -> str:
     """Converte una data dal formato DD/MM/YYYY a YYYY-MM-DD"""
     if not date_str:
@@ -222,7 +422,7 @@ async def upload_cv(files: List[UploadFile] = File(...)):
                     })
                     continue
 
-                analysis_result = cv_analyzer.analyze_cv(parse_result['text'])
+                analysis_result = await run_in_threadpool(cv_analyzer.analyze_cv, parse_result['text'])
                 
                 if analysis_result['status'] == 'error':
                     responses.append({
@@ -235,6 +435,8 @@ async def upload_cv(files: List[UploadFile] = File(...)):
                 # Store in Supabase
                 try:
                     analyzed_data = analysis_result['analysis']
+                    # Con l'estrazione locale (modelli non disponibili) il profilo e' incompleto
+                    partial = analysis_result.get('source') == 'local'
                     
                     # Prepare profile data
                     profile_data = {
@@ -244,6 +446,7 @@ async def upload_cv(files: List[UploadFile] = File(...)):
                         "cognome": analyzed_data.get("cognome"),
                         "citta": analyzed_data.get("citta"),
                         "data_nascita": convert_date_format(analyzed_data.get("data_nascita")),
+                        "email": analyzed_data.get("email"),
                         "cellulare": analyzed_data.get("cellulare"),
                         "anni_esperienza": analyzed_data.get("anni_esperienza"),
                         "competenze": analyzed_data.get("competenze"),
@@ -261,15 +464,22 @@ async def upload_cv(files: List[UploadFile] = File(...)):
                     result = supabase.table("cv_profiles").insert(profile_data).execute()
                     profile_id = result.data[0]["id"]
                     
-                    # Update status to completed
-                    supabase.table("cv_profiles").update(
-                        {"process_status": "completed"}
+                    # Update status to completed (partial se l'analisi e' incompleta)
+                    process_status = "partial" if partial else "completed"
+                    updated = supabase.table("cv_profiles").update(
+                        {"process_status": process_status}
                     ).eq("id", profile_id).execute()
 
+                    await run_in_threadpool(_sync_indexes, (updated.data or result.data)[0])
+
                     responses.append({
                         "filename": file.filename,
-                        "status": "success",
-                        "message": "CV processato con successo",
+                        "status": "partial" if partial else "success",
+                        "message": (
+                            "CV salvato parzialmente: analisi non disponibile, estratti solo email e cellulare"
+                            if partial else "CV processato con successo"
+                        ),
+                        "source": analysis_result.get('source'),
                         "cv_id": profile_id
                     })
 
@@ -301,23 +511,44 @@ async def upload_cv(files: List[UploadFile] = File(...)):
         logger.error(f"Batch upload error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/match")
+async def match_cvs(request: JobMatchRequest):
+    """Ordina i CV per rilevanza BM25 rispetto al testo di un annuncio di lavoro."""
+    try:
+        await run_in_threadpool(_refresh_indexes)
+        matches = await run_in_threadpool(cv_search_index.search, request.descrizione, request.top_k)
+        if not matches:
+            return {"items": [], "total": 0}
+
+        scores = dict(matches)
+        items = [dict(row, match_score=scores[str(row['id'])]) for row in fetch_rows_by_ids('cv_profiles', list(scores))]
+        items.sort(key=lambda row: row['match_score'], reverse=True)
+
+        return {"items": items, "total": len(items)}
+
+    except Exception as e:
+        logger.error(f"Error in match_cvs: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/{cv_id}")
-async def get_cv(cv_id: str):
+async def get_cv(cv_id: str, response: Response, if_none_match: Optional[str] = Header(None)):
     try:
         result = supabase.from_('cv_profiles').select('*').eq('id', cv_id).single().execute()
         
         if not result.data:
             raise HTTPException(status_code=404, detail="CV not found")
             
-        return result.data
+        return _conditional_response(result.data, if_none_match, response)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 
-@router.put("/{cv_id}")
-async def update_cv(cv_id: str, cv: CV):
+@router.api_route("/{cv_id}", methods=["PUT", "PATCH"])
+async def update_cv(cv_id: str, cv: CV, response: Response, if_match: Optional[str] = Header(None)):
     try:
         # Converti il modello in dict per Supabase
         cv_dict = cv.model_dump(exclude_unset=True)
@@ -329,14 +560,48 @@ async def update_cv(cv_id: str, cv: CV):
             cv_dict['scadenza_contratto'] = cv_dict['scadenza_contratto'].isoformat()
         if cv_dict.get('ultimo_contatto'):
             cv_dict['ultimo_contatto'] = cv_dict['ultimo_contatto'].isoformat()
-            
-        result = supabase.table('cv_profiles').update(cv_dict).eq('id', cv_id).execute()
+
+        current = supabase.table('cv_profiles').select('*').eq('id', cv_id).execute()
+        if not current.data:
+            raise HTTPException(status_code=404, detail="CV not found")
+        current_row = current.data[0]
+
+        # If-Match: rifiuta la modifica se il CV e' cambiato dopo che il client l'ha letto
+        if if_match and not etag_matches(if_match, compute_etag(current_row)):
+            raise HTTPException(status_code=412, detail="Il CV è stato modificato da un altro utente")
+
+        # Invia solo le colonne effettivamente cambiate
+        changes = {
+            k: v for k, v in cv_dict.items()
+            if k not in ('id', 'created_at') and current_row.get(k) != v
+        }
+        if not changes:
+            response.headers["ETag"] = compute_etag(current_row)
+            return current_row
+
+        query = supabase.table('cv_profiles').update(changes).eq('id', cv_id)
+        if if_match:
+            # Aggiornamento condizionato: updated_at (aggiornato da un trigger a ogni
+            # modifica, vedi supabase/migrations) deve essere ancora quello letto,
+            # altrimenti nessuna riga viene aggiornata
+            if current_row.get('updated_at') is not None:
+                query = query.eq('updated_at', current_row['updated_at'])
+            else:
+                logger.warning("cv_profiles.updated_at assente: If-Match verificato solo in lettura")
+        result = query.execute()
         
         if not result.data:
+            if if_match:
+                raise HTTPException(status_code=412, detail="Il CV è stato modificato da un altro utente")
+            # Senza If-Match una risposta vuota significa che il CV e' stato eliminato nel frattempo
             raise HTTPException(status_code=404, detail="CV not found")
-            
+
+        await run_in_threadpool(_sync_indexes, result.data[0])
+        response.headers["ETag"] = compute_etag(result.data[0])
         return result.data[0]
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -347,13 +612,15 @@ async def delete_cv(cv_id: str):
         
         if not result.data:
             raise HTTPException(status_code=404, detail="CV not found")
-            
+
+        await run_in_threadpool(_drop_from_indexes, cv_id)
         return {"message": "CV deleted successfully"}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/filters/tools")
+@_shared_cached("filters:tools")
 async def get_tools_filters():
     try:
         # Ottieni tutti i CV
@@ -377,6 +644,7 @@ async def get_tools_filters():
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/filters/database")
+@_shared_cached("filters:database")
 async def get_database_filters():
     try:
         result = supabase.from_('cv_profiles').select('database').execute()
@@ -396,6 +664,7 @@ async def get_database_filters():
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/filters/linguaggi")
+@_shared_cached("filters:linguaggi")
 async def get_linguaggi_filters():
     try:
         result = supabase.from_('cv_profiles').select('linguaggi_programmazione').execute()
@@ -415,6 +684,7 @@ async def get_linguaggi_filters():
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/filters/piattaforme")
+@_shared_cached("filters:piattaforme")
 async def get_piattaforme_filters():
     try:
         result = supabase.from_('cv_profiles').select('piattaforme').execute()
@@ -434,6 +704,7 @@ async def get_piattaforme_filters():
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/filters/sistemi-operativi")
+@_shared_cached("filters:sistemi_operativi")
 async def get_sistemi_operativi_filters():
     try:
         result = supabase.from_('cv_profiles').select('sistemi_operativi').execute()
@@ -453,6 +724,7 @@ async def get_sistemi_operativi_filters():
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/filters/citta")
+@_shared_cached("filters:citta")
 async def get_citta_filters():
     try:
         result = supabase.from_('cv_profiles').select('citta').execute()
@@ -0,0 +1,198 @@
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# Classi di costo: unita' eseguibili in parallelo, richieste in coda, attesa massima (s)
+COST_CLASSES = {
+    "interactive": (32, 64, 2.0),
+    "listing": (8, 16, 5.0),
+    "upload": (4, 4, 30.0),
+}
+# Listing fino a questa dimensione di pagina sono considerati interattivi
+INTERACTIVE_PAGE_SIZE = 100
+# Righe di listing che valgono un'unita' di costo
+LISTING_ROWS_PER_UNIT = 500
+# Dimensione media di un CV: ogni blocco stima una chiamata al modello
+UPLOAD_BYTES_PER_UNIT = 256 * 1024
+MAX_UPLOAD_UNITS = 10
+
+
+class CostClassQueue:
+    """Semaforo pesato con coda FIFO limitata per una classe di costo."""
+
+    def __init__(self, name: str, capacity: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_use = 0
+        self.waiters = deque()
+        self.admitted_total = 0
+        self.shed_total = {"queue_full": 0, "timeout": 0}
+        # Media mobile del tempo di servizio, usata per stimare Retry-After
+        self.avg_service_time = 1.0
+
+    def retry_after(self) -> int:
+        backlog = len(self.waiters) + 1
+        return max(1, math.ceil(self.avg_service_time * backlog / self.capacity))
+
+    def _shed(self, reason: str, status_code: int):
+        self.shed_total[reason] += 1
+        logger.warning(f"Richiesta scartata (classe {self.name}, {reason})")
+        raise HTTPException(
+            status_code=status_code,
+            detail="Server sovraccarico, riprova più tardi",
+            headers={"Retry-After": str(self.retry_after())},
+        )
+
+    async def acquire(self, units: int):
+        units = min(units, self.capacity)
+        if not self.waiters and self.in_use + units <= self.capacity:
+            self.in_use += units
+            self.admitted_total += 1
+            return units
+
+        # Coda piena: rifiuta subito invece di accumulare latenza
+        if len(self.waiters) >= self.max_queue:
+            self._shed("queue_full", 429)
+
+        waiter = (asyncio.get_running_loop().create_future(), units)
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter[0]), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            if waiter[0].done():
+                # Ammessa proprio allo scadere: teniamo lo slot
+                self.admitted_total += 1
+                return units
+            self._abandon(waiter)
+            self._shed("timeout", 503)
+        except asyncio.CancelledError:
+            if waiter[0].done():
+                # Ammessa ma mai servita: non deve abbassare il tempo di servizio medio
+                self.release(units)
+            else:
+                self._abandon(waiter)
+            raise
+        self.admitted_total += 1
+        return units
+
+    def _abandon(self, waiter):
+        # Il waiter rimosso poteva bloccare la testa della coda: chi segue puo' partire
+        self.waiters.remove(waiter)
+        self._wake()
+
+    def release(self, units: int, elapsed: Optional[float] = None):
+        self.in_use -= units
+        if elapsed is not None:
+            self.avg_service_time = 0.9 * self.avg_service_time + 0.1 * elapsed
+        self._wake()
+
+    def _wake(self):
+        while self.waiters and self.in_use + self.waiters[0][1] <= self.capacity:
+            future, waiting_units = self.waiters.popleft()
+            self.in_use += waiting_units
+            future.set_result(True)
+
+
+class AdmissionController:
+    """
+    Controllo di ammissione in base al costo stimato della richiesta.
+
+    Ogni richiesta e' assegnata a una classe (interactive, listing, upload) con un
+    peso in unita'; le classi hanno code separate, cosi' listing enormi e upload
+    con molti file non bloccano le richieste interattive come GET /cv/{id}.
+    Quando una coda e' piena o l'attesa supera il limite risponde 429/503 con Retry-After.
+    """
+
+    def __init__(self, classes: Dict[str, Tuple[int, int, float]] = COST_CLASSES):
+        self.queues = {
+            name: CostClassQueue(name, capacity, max_queue, max_wait)
+            for name, (capacity, max_queue, max_wait) in classes.items()
+        }
+
+    @staticmethod
+    def estimate_cost(request: Request) -> Tuple[str, int]:
+        """Restituisce (classe di costo, unita') stimate da metodo, percorso e parametri."""
+        path = request.url.path.rstrip('/')
+        if request.method == "POST" and path.endswith("/upload"):
+            try:
+                size = int(request.headers.get("content-length") or 0)
+            except ValueError:
+                size = 0
+            return "upload", min(MAX_UPLOAD_UNITS, max(1, math.ceil(size / UPLOAD_BYTES_PER_UNIT)))
+        if request.method == "POST" and path.endswith("/match"):
+            return "listing", 1
+        if request.method == "GET" and path.endswith("/cv"):
+            try:
+                page_size = int(request.query_params.get("page_size", 10))
+            except ValueError:
+                page_size = 10
+            if request.query_params.get("sort_by") == "match" or page_size > INTERACTIVE_PAGE_SIZE:
+                return "listing", max(1, math.ceil(page_size / LISTING_ROWS_PER_UNIT))
+        return "interactive", 1
+
+    @asynccontextmanager
+    async def admit(self, request: Request):
+        name, units = self.estimate_cost(request)
+        queue = self.queues[name]
+        units = await queue.acquire(units)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            queue.release(units, time.monotonic() - started)
+
+    def metrics(self) -> str:
+        """
+        Metriche in formato testo Prometheus. I contatori sono del singolo processo
+        (etichetta pid): con piu' worker uvicorn ogni worker va letto separatamente
+        e i valori sommati lato Prometheus, es. sum without (pid) (...).
+        """
+        families = {
+            "cv_admission_in_flight_units": ("gauge", lambda q: [({}, q.in_use)]),
+            "cv_admission_queue_length": ("gauge", lambda q: [({}, len(q.waiters))]),
+            "cv_admission_admitted_total": ("counter", lambda q: [({}, q.admitted_total)]),
+            "cv_admission_shed_total": ("counter", lambda q: [({"reason": r}, c) for r, c in q.shed_total.items()]),
+        }
+        lines = []
+        for metric, (metric_type, samples) in families.items():
+            lines.append(f"# TYPE {metric} {metric_type}")
+            for name, queue in self.queues.items():
+                for labels, value in samples(queue):
+                    label_str = ",".join(
+                        f'{k}="{v}"' for k, v in dict({"class": name, "pid": os.getpid()}, **labels).items()
+                    )
+                    lines.append(f"{metric}{{{label_str}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Create a singleton instance
+admission_controller = AdmissionController()
+
+
+async def admission_control(request: Request, call_next):
+    """
+    Middleware HTTP: decide l'ammissione dagli header (content-length per gli upload)
+    prima che il corpo della richiesta venga letto, e tiene occupato lo slot fino
+    alla risposta. Si applica solo alle API dei CV.
+    """
+    if not request.url.path.startswith("/cv"):
+        return await call_next(request)
+    try:
+        async with admission_controller.admit(request):
+            return await call_next(request)
+    except HTTPException as e:
+        if e.status_code not in (429, 503):
+            raise
+        return JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 
@@ -8,6 +9,29 @@ class Settings(BaseSettings):
     SUPABASE_KEY: str
     GEMINI_API_KEY: str
 
+    # Analisi CV: modello principale e catena di fallback (nomi separati da virgola)
+    GEMINI_MODEL: str = "gemini-1.5-flash"
+    GEMINI_FALLBACK_MODELS: str = "gemini-1.5-flash-8b"
+    # Se tutti i modelli falliscono, estrae localmente almeno email e cellulare
+    # (il CV viene salvato con stato "partial")
+    GEMINI_LOCAL_FALLBACK: bool = False
+    # Tempo massimo (secondi) per ogni modello della catena
+    GEMINI_TIMEOUT: float = 20.0
+    # Tempo massimo (secondi) per l'intera analisi di un CV, fallback e nuovi tentativi inclusi
+    GEMINI_ANALYSIS_TIMEOUT: float = 30.0
+    # La richiesta duplicata parte dopo questo percentile delle latenze osservate
+    GEMINI_HEDGE_PERCENTILE: float = 95.0
+    GEMINI_HEDGE_MIN_DELAY: float = 2.0
+    # Richieste duplicate in volo al massimo, per non saturare i thread verso Gemini
+    GEMINI_MAX_HEDGED: int = 4
+    # Circuit breaker: errori consecutivi prima dell'apertura e secondi prima di riprovare
+    GEMINI_BREAKER_FAILURES: int = 5
+    GEMINI_BREAKER_RESET: float = 30.0
+
+    # Directory della cache condivisa tra i worker (default /dev/shm); il nome della
+    # sottodirectory deriva da SUPABASE_URL, cosi' istanze su progetti diversi non si mescolano
+    SHARED_CACHE_DIR: Optional[str] = None
+
     class Config:
         env_file = ".env"
 
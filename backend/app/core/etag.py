@@ -0,0 +1,29 @@
+import json
+import hashlib
+from typing import Any, Optional
+
+
+def compute_etag(data: Any) -> str:
+    """ETag forte: hash della rappresentazione JSON canonica della risposta."""
+    body = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str, ensure_ascii=False)
+    return '"' + hashlib.sha256(body.encode('utf-8')).hexdigest()[:32] + '"'
+
+
+def etag_matches(header: Optional[str], etag: str, weak: bool = False) -> bool:
+    """
+    Confronta un header If-Match / If-None-Match con l'ETag corrente.
+    If-None-Match usa il confronto debole (weak=True), If-Match quello forte.
+    """
+    if not header:
+        return False
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if candidate.startswith('W/'):
+            if not weak:
+                continue
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
@@ -0,0 +1,216 @@
+import os
+import json
+import stat
+import mmap
+import fcntl
+import struct
+import hashlib
+import logging
+import tempfile
+import threading
+import time
+from typing import Any, List, Optional
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('<Q')
+
+
+class SharedCache:
+    """
+    Cache condivisa tra i worker uvicorn dello stesso host.
+
+    Il numero di versione globale vive in un segmento di memoria condivisa
+    (file in /dev/shm mappato con mmap) e viene incrementato sotto flock a ogni
+    scrittura sul database, da qualunque worker. Ogni voce della cache e' un file
+    nella stessa directory, marcato con la versione con cui e' stata costruita:
+    una voce con versione diversa da quella corrente e' scaduta, quindi
+    un'invalidazione e' visibile a tutti i worker appena il contatore cambia.
+
+    Ogni incremento registra anche un evento (es. id del CV modificato) in un log
+    condiviso, che gli altri worker usano per aggiornare i propri indici in memoria.
+
+    Le voci vengono restituite come risposte dell'API: la directory e' creata con
+    permessi 0700 e non viene usata se appartiene a un altro utente.
+    """
+
+    # Voci piu' grandi non vengono salvate (es. listing con page_size molto alto)
+    MAX_ENTRY_BYTES = 8 * 1024 * 1024
+    # Limiti complessivi: oltre questi si eliminano le voci scritte per prime
+    MAX_ENTRIES = 512
+    MAX_TOTAL_BYTES = 64 * 1024 * 1024
+    # Durata massima di una voce (s): copre le scritture fatte fuori dall'API,
+    # che non incrementano la versione
+    TTL = 300
+    # Eventi conservati nel log: chi e' rimasto piu' indietro ricostruisce da zero
+    MAX_EVENTS = 10000
+
+    def __init__(self, name: str = 'cv-cache', directory: Optional[str] = None):
+        if directory is None:
+            directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        self.path = os.path.join(directory, name)
+        self._lock = threading.Lock()
+        self._fd = None
+        self._version = None
+
+    def _open(self):
+        # Apertura pigra: ogni processo worker crea la propria mappatura
+        if self._fd is not None:
+            return
+        with self._lock:
+            if self._fd is not None:
+                return
+            self._check_directory()
+            fd = os.open(os.path.join(self.path, 'version'), os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(fd).st_size < HEADER.size:
+                os.ftruncate(fd, HEADER.size)
+            self._version = mmap.mmap(fd, HEADER.size)
+            self._fd = fd
+
+    def _check_directory(self):
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+        info = os.lstat(self.path)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+            raise PermissionError(f"Directory della cache {self.path} non valida o di un altro utente")
+        if stat.S_IMODE(info.st_mode) & 0o077:
+            os.chmod(self.path, 0o700)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, 'entry-' + hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def version(self) -> int:
+        self._open()
+        return HEADER.unpack_from(self._version, 0)[0]
+
+    def get(self, key: str) -> Optional[Any]:
+        """Restituisce il valore salvato, oppure None se assente o scaduto."""
+        try:
+            with open(self._entry_path(key), 'rb') as f:
+                if time.time() - os.fstat(f.fileno()).st_mtime > self.TTL:
+                    return None
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        if len(data) < HEADER.size or HEADER.unpack_from(data, 0)[0] != self.version():
+            return None
+        return json.loads(data[HEADER.size:])
+
+    def set(self, key: str, value: Any, version: int) -> Any:
+        """
+        Salva value marcato con version, la versione letta PRIMA di costruirlo:
+        se nel frattempo un worker ha scritto, il valore e' gia' vecchio e non viene salvato.
+        Restituisce value per comodita'.
+        """
+        if version != self.version():
+            return value
+        body = json.dumps(value, default=str).encode('utf-8')
+        if len(body) > self.MAX_ENTRY_BYTES:
+            return value
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(HEADER.pack(version) + body)
+            # Rename atomico: i lettori vedono la voce vecchia o quella nuova, mai a meta'
+            os.replace(tmp_path, self._entry_path(key))
+            self._evict()
+        except OSError as e:
+            logger.warning(f"Impossibile salvare la voce di cache {key}: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        return value
+
+    def _evict(self):
+        """Elimina le voci scadute e, oltre i limiti di numero o dimensione, le piu' vecchie."""
+        entries = []
+        now = time.time()
+        for entry in os.scandir(self.path):
+            if not entry.name.startswith('entry-'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.TTL:
+                self._unlink(entry.path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        count = len(entries)
+        for _, size, path in entries:
+            if count <= self.MAX_ENTRIES and total <= self.MAX_TOTAL_BYTES:
+                break
+            self._unlink(path)
+            count -= 1
+            total -= size
+
+    @staticmethod
+    def _unlink(path: str):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def invalidate(self, event: Optional[dict] = None) -> int:
+        """Incrementa la versione globale (scadono tutte le voci) e registra l'evento."""
+        self._open()
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                version = HEADER.unpack_from(self._version, 0)[0] + 1
+                HEADER.pack_into(self._version, 0, version)
+                self._append_event(version, event or {})
+                self._remove_entries()
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return version
+
+    def _append_event(self, version: int, event: dict):
+        log_path = os.path.join(self.path, 'events.log')
+        with open(log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(dict(event, version=version)) + '\n')
+        if os.path.getsize(log_path) > self.MAX_EVENTS * 128:
+            with open(log_path, encoding='utf-8') as f:
+                lines = f.readlines()[-self.MAX_EVENTS // 2:]
+            with open(log_path, 'w', encoding='utf-8') as f:
+                f.writelines(lines)
+
+    def _remove_entries(self):
+        # Le voci sono gia' scadute: eliminarle evita che i listing si accumulino
+        for entry in os.scandir(self.path):
+            if entry.name.startswith('entry-'):
+                self._unlink(entry.path)
+
+    def events_since(self, version: int) -> Optional[List[dict]]:
+        """
+        Eventi con versione successiva a version, in ordine. Restituisce None se il
+        log non copre piu' quell'intervallo (il chiamante deve ricostruire da zero).
+        """
+        self._open()
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_SH)
+            try:
+                current = HEADER.unpack_from(self._version, 0)[0]
+                if current == version:
+                    return []
+                try:
+                    with open(os.path.join(self.path, 'events.log'), encoding='utf-8') as f:
+                        events = [json.loads(line) for line in f if line.strip()]
+                except FileNotFoundError:
+                    events = []
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+        newer = [e for e in events if e['version'] > version]
+        if len(newer) != current - version:
+            return None
+        return newer
+
+
+# Create a singleton instance
+shared_cache = SharedCache(
+    'cv-cache-' + hashlib.sha1(settings.SUPABASE_URL.encode('utf-8')).hexdigest()[:12],
+    settings.SHARED_CACHE_DIR,
+)
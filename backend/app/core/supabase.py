@@ -4,4 +4,33 @@ from .config import settings
 supabase = create_client(
     settings.SUPABASE_URL,
     settings.SUPABASE_KEY
-)
\ No newline at end of file
+)
+
+
+def fetch_all_rows(table: str, columns: str = '*', page_size: int = 1000, filters=None) -> list:
+    """
+    Legge tutte le righe di una tabella a blocchi (PostgREST limita ogni risposta).
+    filters, se indicato, riceve la query di ogni blocco e restituisce la query filtrata.
+    """
+    rows = []
+    start = 0
+    while True:
+        query = supabase.from_(table).select(columns)
+        if filters is not None:
+            query = filters(query)
+        # Ordine stabile, altrimenti i blocchi possono sovrapporsi o saltare righe
+        result = query.order('id').range(start, start + page_size - 1).execute()
+        batch = result.data or []
+        rows.extend(batch)
+        if len(batch) < page_size:
+            return rows
+        start += page_size
+
+
+def fetch_rows_by_ids(table: str, ids: list, columns: str = '*', batch_size: int = 200) -> list:
+    """Legge le righe con gli id indicati, a blocchi per non superare la lunghezza massima dell'URL."""
+    rows = []
+    for start in range(0, len(ids), batch_size):
+        result = supabase.from_(table).select(columns).in_('id', ids[start:start + batch_size]).execute()
+        rows.extend(result.data or [])
+    return rows
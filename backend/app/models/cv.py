@@ -1,4 +1,4 @@
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional, List
 from datetime import date, datetime
 import json
@@ -55,7 +55,7 @@ class CV(BaseModel):
     def json(self, **kwargs):
         return json.dumps(self.dict(), cls=DateEncoder)
 
-    @field_validator('data_nascita', 'scadenza_contratto', 'ultimo_contatto')
+    @field_validator('data_nascita', 'scadenza_contratto', 'ultimo_contatto', mode='before')
     def parse_date(cls, v):
         if isinstance(v, str):
             try:
@@ -70,4 +70,10 @@ class CV(BaseModel):
                     except ValueError:
                         continue
                 raise ValueError('Formato data non valido. Usa DD/MM/YYYY')
-        return v
\ No newline at end of file
+        return v
+
+
+class JobMatchRequest(BaseModel):
+    # Testo libero dell'annuncio di lavoro
+    descrizione: str = Field(..., min_length=1)
+    top_k: int = Field(20, ge=1, le=500)
@@ -1,9 +1,102 @@
 import os
-import json
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import get_args, get_origin
 import google.generativeai as genai
 from dotenv import load_dotenv
+from pydantic import ValidationError
+from app.core.config import settings
+from app.models.cv import CV
+from app.services.cv_parser import cv_parser
+from app.services.json_stream import IncrementalJSONObjectParser, JSONFieldError
+
+logger = logging.getLogger(__name__)
+
+# Campi del modello CV estratti dall'analisi, nell'ordine in cui li chiediamo
+ANALYSIS_FIELDS = (
+    "nome", "cognome", "citta", "data_nascita", "email", "cellulare", "anni_esperienza",
+    "competenze", "tools", "database", "piattaforme", "sistemi_operativi", "linguaggi_programmazione",
+)
+
+
+def cv_response_schema(fields=ANALYSIS_FIELDS) -> dict:
+    """Schema JSON (formato Gemini) ricavato dai tipi dei campi del modello CV."""
+    properties = {}
+    for name in fields:
+        annotation = CV.model_fields[name].annotation
+        # Optional[X] -> X
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        if get_origin(annotation) is not list and args:
+            annotation = args[0]
+
+        if get_origin(annotation) is list:
+            properties[name] = {"type": "ARRAY", "items": {"type": "STRING"}, "nullable": True}
+        elif annotation is int:
+            properties[name] = {"type": "INTEGER", "nullable": True}
+        else:
+            # Stringhe e date (le date restano DD/MM/YYYY come da prompt)
+            properties[name] = {"type": "STRING", "nullable": True}
+    return {"type": "OBJECT", "properties": properties}
+
+
+class CircuitBreakerOpen(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Interrompe le chiamate a un modello dopo troppi errori consecutivi.
+    Trascorso reset_timeout lascia passare una sola chiamata di prova (half-open):
+    se riesce il circuito si richiude, altrimenti resta aperto per un altro periodo.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probe_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
 
 class CVAnalyzer:
+    # Latenze minime osservate prima di usare il percentile per l'hedging
+    MIN_LATENCY_SAMPLES = 20
+
     def __init__(self):
         load_dotenv()
         api_key = os.getenv('GEMINI_API_KEY')
@@ -16,11 +109,171 @@ class CVAnalyzer:
             "top_p": 0.8,
             "max_output_tokens": 2048,
         }
-        self.model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash",
-            generation_config=self.generation_config
+
+        # Catena dei modelli: il primo e' il principale, gli altri sono i fallback
+        fallback_models = [m.strip() for m in settings.GEMINI_FALLBACK_MODELS.split(',') if m.strip()]
+        self.model_chain = [settings.GEMINI_MODEL] + [m for m in fallback_models if m != settings.GEMINI_MODEL]
+        self.models = {
+            name: genai.GenerativeModel(model_name=name, generation_config=self.generation_config)
+            for name in self.model_chain
+        }
+        self.model = self.models[settings.GEMINI_MODEL]
+
+        self.breakers = {
+            name: CircuitBreaker(settings.GEMINI_BREAKER_FAILURES, settings.GEMINI_BREAKER_RESET)
+            for name in self.model_chain
+        }
+        self._latencies = {name: deque(maxlen=200) for name in self.model_chain}
+        self._schemas = {ANALYSIS_FIELDS: cv_response_schema()}
+        # Le richieste abbandonate (hedging, deadline) terminano in background
+        self._executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='gemini')
+        self._hedge_slots = threading.BoundedSemaphore(settings.GEMINI_MAX_HEDGED)
+
+    def _hedge_delay(self, model_name: str) -> float:
+        """
+        Attesa prima di inviare la richiesta duplicata: percentile delle latenze recenti.
+        Finche' i campioni sono pochi si usa meta' del timeout, per non duplicare ogni chiamata.
+        """
+        samples = sorted(self._latencies[model_name])
+        if len(samples) < self.MIN_LATENCY_SAMPLES:
+            return max(settings.GEMINI_HEDGE_MIN_DELAY, settings.GEMINI_TIMEOUT / 2)
+        index = min(len(samples) - 1, int(len(samples) * settings.GEMINI_HEDGE_PERCENTILE / 100))
+        return max(settings.GEMINI_HEDGE_MIN_DELAY, samples[index])
+
+    def _json_config(self, fields) -> dict:
+        """Configurazione che vincola l'output allo schema dei soli campi richiesti."""
+        fields = tuple(fields)
+        if fields not in self._schemas:
+            self._schemas[fields] = cv_response_schema(fields)
+        return dict(
+            self.generation_config,
+            response_mime_type="application/json",
+            response_schema=self._schemas[fields],
         )
 
+    @staticmethod
+    def _chunk_text(chunk) -> str:
+        # L'ultimo chunk puo' contenere solo il finish_reason, senza testo
+        try:
+            return chunk.text
+        except ValueError:
+            return ''
+
+    @staticmethod
+    def _validate_field(name, value) -> bool:
+        try:
+            CV.model_validate({name: value})
+            return True
+        except ValidationError:
+            return False
+
+    def _generate(self, model_name: str, prompt, timeout: float, fields) -> dict:
+        """
+        Genera in streaming e valida ogni campo appena il parser incrementale lo
+        completa. Restituisce i valori validi, i campi da richiedere di nuovo
+        (malformati, non validi o troncati) e il testo grezzo.
+        """
+        started = time.monotonic()
+        response = self.models[model_name].generate_content(
+            prompt,
+            stream=True,
+            generation_config=self._json_config(fields),
+            request_options={"timeout": timeout}
+        )
+
+        parser = IncrementalJSONObjectParser()
+        values, invalid = {}, set()
+        for chunk in response:
+            for name, value in parser.feed(self._chunk_text(chunk)):
+                if name not in fields:
+                    continue
+                if isinstance(value, JSONFieldError) or not self._validate_field(name, value):
+                    invalid.add(name)
+                else:
+                    values[name] = value
+
+        if not parser.text.strip():
+            raise ValueError('Nessuna risposta generata dal modello')
+        if not parser.complete:
+            # Stream interrotto: i campi non ancora ricevuti vanno richiesti di nuovo
+            invalid.update(name for name in fields if name not in values)
+        self._latencies[model_name].append(time.monotonic() - started)
+        return {'values': values, 'invalid': invalid, 'text': parser.text}
+
+    def _generate_hedged(self, model_name: str, prompt, fields, deadline: float) -> dict:
+        """
+        Chiama il modello entro GEMINI_TIMEOUT secondi, senza superare deadline
+        (time.monotonic() dell'intera analisi). Se la prima richiesta non ha
+        risposto entro il ritardo di hedging ne invia una seconda e usa la prima
+        risposta valida che arriva.
+        """
+        started = time.monotonic()
+        deadline = min(deadline, started + settings.GEMINI_TIMEOUT)
+        timeout = deadline - started
+        futures = [self._executor.submit(self._generate, model_name, prompt, timeout, fields)]
+        done, _ = wait(futures, timeout=min(self._hedge_delay(model_name), timeout))
+
+        if not done:
+            remaining = deadline - time.monotonic()
+            # Senza slot liberi si aspetta solo la prima richiesta
+            if remaining > 0 and self._hedge_slots.acquire(blocking=False):
+                logger.info(f"Hedging: seconda richiesta a {model_name}")
+                hedge = self._executor.submit(self._generate, model_name, prompt, remaining, fields)
+                hedge.add_done_callback(lambda _: self._hedge_slots.release())
+                futures.append(hedge)
+
+        last_error = None
+        while futures:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = wait(futures, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                futures.remove(future)
+                if future.exception() is None:
+                    return future.result()
+                last_error = future.exception()
+
+        if futures or last_error is None:
+            # Anche le chiamate scadute entrano nelle latenze, altrimenti il percentile
+            # di hedging non vedrebbe mai la coda lenta
+            self._latencies[model_name].append(time.monotonic() - started)
+            raise TimeoutError(f"Timeout di {timeout:.1f}s superato per {model_name}")
+        raise last_error
+
+    def _call_models(self, prompt, fields, deadline: float, model_chain=None):
+        """
+        Percorre la catena dei modelli (model_chain, di default quella configurata)
+        saltando quelli con il circuit breaker aperto, finche' resta tempo prima di deadline.
+        Restituisce (risultato, nome modello) oppure (None, ultimo errore).
+        """
+        last_error = None
+        for model_name in model_chain or self.model_chain:
+            if time.monotonic() >= deadline:
+                last_error = TimeoutError(f"Timeout di {settings.GEMINI_ANALYSIS_TIMEOUT}s superato per l'analisi")
+                break
+            breaker = self.breakers[model_name]
+            if not breaker.allow_request():
+                last_error = CircuitBreakerOpen(f"Circuit breaker aperto per {model_name}")
+                continue
+            try:
+                result = self._generate_hedged(model_name, prompt, fields, deadline)
+                breaker.record_success()
+                return result, model_name
+            except Exception as e:
+                breaker.record_failure()
+                last_error = e
+                logger.warning(f"Analisi con {model_name} fallita: {str(e)}")
+        return None, last_error
+
+    def _local_analysis(self, cv_text: str) -> dict:
+        """Fallback senza LLM: estrae solo i dati riconoscibili con espressioni regolari."""
+        basic_info = cv_parser.extract_basic_info(cv_text)
+        return {
+            "email": basic_info.get("email"),
+            "cellulare": (basic_info.get("telefono") or "").strip() or None,
+        }
+
     def analyze_cv(self, cv_text):
         """
         Analizza il testo del CV e restituisce un dizionario con i risultati o gli errori.
@@ -66,35 +319,51 @@ class CVAnalyzer:
                 cv_text
             ]
 
-            response = self.model.generate_content(prompt)
-            
-            if not response or not response.text:
+            # Un'unica scadenza per tutta l'analisi: fallback e nuovi tentativi usano il tempo rimasto
+            deadline = time.monotonic() + settings.GEMINI_ANALYSIS_TIMEOUT
+            result, source = self._call_models(prompt, ANALYSIS_FIELDS, deadline)
+
+            if result is None:
+                if settings.GEMINI_LOCAL_FALLBACK:
+                    logger.warning("Tutti i modelli non disponibili, uso l'estrazione locale")
+                    return {
+                        'status': 'success',
+                        'analysis': self._local_analysis(cv_text),
+                        'source': 'local'
+                    }
                 return {
                     'status': 'error',
-                    'message': 'Nessuna risposta generata dal modello'
+                    'message': f'Servizio di analisi non disponibile: {str(source)}'
                 }
 
-            # Parse the JSON response
-            try:
-                # Clean the response text (remove any non-JSON content)
-                json_str = response.text.strip()
-                # If there's any markdown code block, clean it
-                if json_str.startswith('```json'):
-                    json_str = json_str.replace('```json', '').replace('```', '')
-                
-                analysis_data = json.loads(json_str.strip())
-                
-                return {
-                    'status': 'success',
-                    'analysis': analysis_data
-                }
-            except json.JSONDecodeError as e:
+            analysis_data = result['values']
+
+            # Richiedi di nuovo solo i campi malformati, non l'intero CV
+            invalid = sorted(result['invalid'])
+            if invalid:
+                logger.info(f"Nuova richiesta per i campi non validi: {invalid}")
+                retry_prompt = prompt + [f"\nRispondi SOLO con i campi: {', '.join(invalid)}"]
+                # Solo al modello che ha appena risposto, nel tempo rimasto
+                retry, _ = self._call_models(retry_prompt, tuple(invalid), deadline, [source])
+                if retry:
+                    analysis_data.update(retry['values'])
+                missing = [name for name in invalid if name not in analysis_data]
+                if missing:
+                    logger.warning(f"Campi scartati dopo il nuovo tentativo: {missing}")
+
+            if not analysis_data:
                 return {
                     'status': 'error',
-                    'message': f'Errore nella decodifica JSON: {str(e)}',
-                    'raw_response': response.text
+                    'message': 'Errore nella decodifica JSON: nessun campo valido nella risposta',
+                    'raw_response': result['text']
                 }
 
+            return {
+                'status': 'success',
+                'analysis': analysis_data,
+                'source': source
+            }
+
         except Exception as e:
             return {
                 'status': 'error',
@@ -0,0 +1,282 @@
+import threading
+import logging
+from typing import Dict, List, Tuple, Any, Optional, Iterable
+
+import numpy as np
+
+from app.core.supabase import fetch_all_rows
+
+logger = logging.getLogger(__name__)
+
+# Numero di bit a 1 per ogni possibile valore di un byte
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+class CVMatcher:
+    """
+    Punteggio di corrispondenza parziale tra i CV e un insieme di requisiti.
+
+    Ogni campo skill di un profilo e' codificato come bitset (np.packbits) sul
+    vocabolario di quel campo, cosi' la sovrapposizione con i requisiti si calcola
+    per tutti i CV con un AND e un popcount vettoriali. Anni di esperienza e RAL
+    desiderata contribuiscono con un punteggio che decresce fuori dall'intervallo.
+    """
+
+    SKILL_FIELDS = ('tools', 'database', 'piattaforme', 'sistemi_operativi', 'linguaggi_programmazione')
+    NUMERIC_FIELDS = ('anni_esperienza', 'stipendio_desiderato')
+    WEIGHTS = {
+        'tools': 1.0,
+        'database': 1.0,
+        'piattaforme': 1.0,
+        'sistemi_operativi': 1.0,
+        'linguaggi_programmazione': 1.0,
+        'anni_esperienza': 0.5,
+        'stipendio_desiderato': 0.5,
+    }
+    # Fuori dall'intervallo il punteggio scende a zero entro questa frazione del limite
+    RANGE_TOLERANCE = 0.5
+    # I bitset crescono a blocchi di 64 bit
+    BLOCK_BYTES = 8
+
+    def __init__(self, initial_capacity: int = 1024):
+        self._lock = threading.RLock()
+        # Serializza i caricamenti dal database senza bloccare ricerche e scritture
+        self._load_lock = threading.Lock()
+        self._loaded = False
+        # Scritture arrivate durante un caricamento, riapplicate alla fine
+        self._backlog: Optional[List[Tuple[str, Any]]] = None
+        self._generation = 0
+        self._initial_capacity = initial_capacity
+        self._reset()
+
+    def _reset(self):
+        capacity = self._initial_capacity
+        self._ids: List[Optional[str]] = []
+        self._row_of: Dict[str, int] = {}
+        self._free_rows: List[int] = []
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._vocab: Dict[str, Dict[str, int]] = {field: {} for field in self.SKILL_FIELDS}
+        self._bits: Dict[str, np.ndarray] = {
+            field: np.zeros((capacity, self.BLOCK_BYTES), dtype=np.uint8) for field in self.SKILL_FIELDS
+        }
+        self._numbers: Dict[str, np.ndarray] = {
+            field: np.full(capacity, np.nan, dtype=np.float64) for field in self.NUMERIC_FIELDS
+        }
+
+    def _grow_rows(self, needed: int):
+        capacity = len(self._alive)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        extra = new_capacity - capacity
+        self._alive = np.concatenate([self._alive, np.zeros(extra, dtype=bool)])
+        for field, bits in self._bits.items():
+            self._bits[field] = np.vstack([bits, np.zeros((extra, bits.shape[1]), dtype=np.uint8)])
+        for field, values in self._numbers.items():
+            self._numbers[field] = np.concatenate([values, np.full(extra, np.nan)])
+
+    def _grow_bits(self, field: str):
+        bits = self._bits[field]
+        needed_bytes = -(-len(self._vocab[field]) // 8)
+        if needed_bytes <= bits.shape[1]:
+            return
+        new_width = -(-needed_bytes // self.BLOCK_BYTES) * self.BLOCK_BYTES
+        self._bits[field] = np.hstack([bits, np.zeros((bits.shape[0], new_width - bits.shape[1]), dtype=np.uint8)])
+
+    def _encode(self, field: str, values: Iterable[str], grow: bool) -> Tuple[np.ndarray, int]:
+        """Restituisce il bitset di un insieme di skill e quante skill sono state richieste."""
+        vocab = self._vocab[field]
+        positions = []
+        requested = 0
+        for value in {v.strip().upper() for v in values or [] if v and v.strip()}:
+            requested += 1
+            if grow:
+                vocab.setdefault(value, len(vocab))
+            if value in vocab:
+                positions.append(vocab[value])
+        if grow:
+            self._grow_bits(field)
+
+        flags = np.zeros(self._bits[field].shape[1] * 8, dtype=bool)
+        flags[positions] = True
+        return np.packbits(flags), requested
+
+    def _store(self, cv_id: str, profile: Dict[str, Any]):
+        row = self._row_of.get(cv_id)
+        if row is None:
+            if self._free_rows:
+                row = self._free_rows.pop()
+                self._ids[row] = cv_id
+            else:
+                row = len(self._ids)
+                self._grow_rows(row + 1)
+                self._ids.append(cv_id)
+            self._row_of[cv_id] = row
+
+        self._alive[row] = True
+        for field in self.SKILL_FIELDS:
+            bits, _ = self._encode(field, profile.get(field), grow=True)
+            self._bits[field][row] = bits
+        for field in self.NUMERIC_FIELDS:
+            value = profile.get(field)
+            self._numbers[field][row] = np.nan if value is None else float(value)
+
+    STATE_FIELDS = ('_ids', '_row_of', '_free_rows', '_alive', '_vocab', '_bits', '_numbers')
+
+    def load(self, profiles: List[Dict[str, Any]], generation: Optional[int] = None):
+        """
+        Ricostruisce i bitset a partire dalle righe di cv_profiles. La costruzione
+        avviene su un'istanza separata, fuori dal lock; le scritture arrivate nel
+        frattempo vengono riapplicate. Se l'indice e' stato invalidato dopo la
+        lettura delle righe, il risultato e' scartato.
+        """
+        fresh = CVMatcher(self._initial_capacity)
+        fresh._grow_rows(len(profiles))
+        for profile in profiles:
+            if profile.get('id') is not None:
+                fresh._store(str(profile['id']), profile)
+
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                self._backlog = None
+                return
+            for name in self.STATE_FIELDS:
+                setattr(self, name, getattr(fresh, name))
+            self._generation += 1
+            self._loaded = True
+            for op, value in self._backlog or []:
+                if op == 'upsert':
+                    self._store(str(value['id']), value)
+                else:
+                    self._remove_locked(value)
+            self._backlog = None
+        logger.info(f"Indice di matching costruito: {len(fresh._row_of)} CV")
+
+    def ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            with self._lock:
+                generation = self._generation
+                self._backlog = []
+            columns = ','.join(('id',) + self.SKILL_FIELDS + self.NUMERIC_FIELDS)
+            self.load(fetch_all_rows('cv_profiles', columns), generation)
+
+    def invalidate(self):
+        """Scarta l'indice: verra' ricostruito dal database alla prossima ricerca."""
+        with self._lock:
+            self._loaded = False
+            self._backlog = None
+            self._generation += 1
+            self._reset()
+
+    def upsert(self, profile: Dict[str, Any]):
+        """Aggiunge o aggiorna un CV; se l'indice non e' ancora stato costruito non fa nulla."""
+        if not profile or profile.get('id') is None:
+            return
+        with self._lock:
+            if self._loaded:
+                self._store(str(profile['id']), profile)
+            elif self._backlog is not None:
+                self._backlog.append(('upsert', profile))
+
+    def _remove_locked(self, cv_id: str):
+        row = self._row_of.pop(cv_id, None)
+        if row is None:
+            return
+        self._alive[row] = False
+        self._ids[row] = None
+        for field in self.SKILL_FIELDS:
+            self._bits[field][row] = 0
+        for field in self.NUMERIC_FIELDS:
+            self._numbers[field][row] = np.nan
+        self._free_rows.append(row)
+
+    def remove(self, cv_id: str):
+        with self._lock:
+            if self._loaded:
+                self._remove_locked(str(cv_id))
+            elif self._backlog is not None:
+                self._backlog.append(('remove', str(cv_id)))
+
+    def _skill_score(self, field: str, values: List[str], rows: int) -> np.ndarray:
+        query, requested = self._encode(field, values, grow=False)
+        # Solo i byte con almeno un bit richiesto contribuiscono alla sovrapposizione
+        cols = np.flatnonzero(query)
+        if not len(cols):
+            return np.zeros(rows, dtype=np.float64)
+        overlap = POPCOUNT[self._bits[field][:rows, cols] & query[cols]].sum(axis=1, dtype=np.int64)
+        return overlap / requested
+
+    def _range_score(self, field: str, low: Optional[float], high: Optional[float], rows: int) -> np.ndarray:
+        values = self._numbers[field][:rows]
+        distance = np.zeros(rows, dtype=np.float64)
+        tolerance = 1.0
+        if low is not None:
+            distance = np.maximum(distance, low - values)
+            tolerance = max(tolerance, abs(low) * self.RANGE_TOLERANCE)
+        if high is not None:
+            distance = np.maximum(distance, values - high)
+            tolerance = max(tolerance, abs(high) * self.RANGE_TOLERANCE)
+        scores = np.clip(1 - distance / tolerance, 0, 1)
+        # I profili senza il valore non guadagnano punti su questo criterio
+        return np.nan_to_num(scores, nan=0.0)
+
+    def rank(
+        self,
+        skills: Dict[str, List[str]],
+        ranges: Dict[str, Tuple[Optional[float], Optional[float]]],
+        candidate_ids: Optional[Iterable[str]] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> Tuple[int, List[Tuple[str, float]]]:
+        """
+        Calcola il punteggio (0-1) di tutti i CV e restituisce il numero di CV con
+        punteggio positivo e la finestra [offset, offset + limit) in ordine decrescente.
+        skills: campo -> skill richieste; ranges: campo numerico -> (minimo, massimo).
+        Se candidate_ids e' indicato, il risultato e' limitato a quei CV.
+        """
+        self.ensure_loaded()
+        with self._lock:
+            rows = len(self._ids)
+            total = np.zeros(rows, dtype=np.float64)
+            total_weight = 0.0
+
+            for field, values in skills.items():
+                if values:
+                    total += self.WEIGHTS[field] * self._skill_score(field, values, rows)
+                    total_weight += self.WEIGHTS[field]
+            for field, (low, high) in ranges.items():
+                if low is not None or high is not None:
+                    total += self.WEIGHTS[field] * self._range_score(field, low, high, rows)
+                    total_weight += self.WEIGHTS[field]
+
+            mask = self._alive[:rows].copy()
+            if candidate_ids is not None:
+                allowed = np.zeros(rows, dtype=bool)
+                allowed[[self._row_of[i] for i in map(str, candidate_ids) if i in self._row_of]] = True
+                mask &= allowed
+
+            if total_weight:
+                total /= total_weight
+                mask &= total > 0
+
+            selected = np.flatnonzero(mask)
+            # Chiave intera univoca: punteggio a 4 decimali e, a parita', ordine di riga,
+            # cosi' le pagine restano stabili anche con argpartition
+            keys = np.round(total[selected] * 10000).astype(np.int64) * rows + (rows - 1 - selected)
+            end = len(selected) if limit is None else min(offset + limit, len(selected))
+            if end <= offset:
+                return len(selected), []
+            if end < len(selected):
+                top = np.argpartition(-keys, end - 1)[:end]
+            else:
+                top = np.arange(len(selected))
+            order = selected[top[np.argsort(-keys[top])]][offset:end]
+            return len(selected), [(self._ids[row], round(float(total[row]), 4)) for row in order]
+
+
+# Create a singleton instance
+cv_matcher = CVMatcher()
@@ -0,0 +1,340 @@
+import re
+import threading
+import logging
+from typing import Dict, List, Tuple, Any, Iterable, Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+from app.core.supabase import fetch_all_rows
+
+logger = logging.getLogger(__name__)
+
+
+class CVSearchIndex:
+    """
+    Indice BM25 in memoria sui profili CV, usato per ordinare i candidati
+    rispetto al testo libero di un annuncio di lavoro.
+
+    Le righe (una per CV) sono divise in una base, con i pesi BM25 gia' calcolati
+    in una matrice sparsa CSC, e in un delta con le righe aggiunte dopo l'ultima
+    ricostruzione: a ogni scrittura si ricalcolano solo i pesi del delta, mentre
+    l'IDF viene applicato al momento della ricerca. Le cancellazioni marcano la
+    riga come non attiva e le modifiche sono una cancellazione seguita da un
+    inserimento. Quando il delta cresce viene fuso nella base da un thread in
+    background, senza bloccare le ricerche.
+    """
+
+    TEXT_FIELDS = ('competenze', 'citta', 'note')
+    SKILL_FIELDS = ('tools', 'database', 'piattaforme', 'sistemi_operativi', 'linguaggi_programmazione')
+    # Le competenze tecniche pesano piu' del testo libero
+    SKILL_BOOST = 2
+    # Compatta la matrice quando le righe cancellate superano questa quota
+    COMPACT_RATIO = 0.25
+    # Righe nel delta oltre le quali viene fuso nella base
+    MERGE_ROWS = 5000
+
+    TOKEN_PATTERN = re.compile(r"[0-9a-zà-ÿ+#]+(?:\.[0-9a-zà-ÿ]+)*")
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        # Serializza i caricamenti dal database senza bloccare ricerche e scritture
+        self._load_lock = threading.Lock()
+        self._loaded = False
+        # Scritture arrivate durante un caricamento, riapplicate alla fine
+        self._backlog: Optional[List[Tuple[str, Any]]] = None
+        self._generation = 0
+        self._merging = False
+        self._reset()
+
+    def _reset(self):
+        self.__dict__.update(self._empty_state())
+
+    @staticmethod
+    def _empty_state() -> Dict[str, Any]:
+        return {
+            '_vocab': {},
+            '_ids': [],
+            '_row_of': {},
+            '_alive': np.zeros(0, dtype=bool),
+            '_doc_len': np.zeros(0, dtype=np.float32),
+            '_df': np.zeros(0, dtype=np.int64),
+            '_base_tf': sp.csr_matrix((0, 0), dtype=np.float32),
+            '_base_weights': sp.csc_matrix((0, 0), dtype=np.float32),
+            '_avg_len': 1.0,
+            '_pending': [],
+            '_delta_weights': None,
+        }
+
+    def tokenize(self, text: str) -> List[str]:
+        """Divide il testo in termini minuscoli; gli underscore dei valori skill separano le parole."""
+        if not text:
+            return []
+        return self.TOKEN_PATTERN.findall(text.lower().replace('_', ' '))
+
+    def _profile_tokens(self, profile: Dict[str, Any]) -> List[str]:
+        tokens = []
+        for field in self.TEXT_FIELDS:
+            value = profile.get(field)
+            if isinstance(value, str):
+                tokens.extend(self.tokenize(value))
+        for field in self.SKILL_FIELDS:
+            for value in profile.get(field) or []:
+                tokens.extend(self.tokenize(value) * self.SKILL_BOOST)
+        return tokens
+
+    @staticmethod
+    def _encode(vocab: Dict[str, int], tokens: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Converte i token in (id termine, frequenza), estendendo il vocabolario."""
+        counts: Dict[int, int] = {}
+        for token in tokens:
+            term_id = vocab.setdefault(token, len(vocab))
+            counts[term_id] = counts.get(term_id, 0) + 1
+        term_ids = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+        freqs = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        return term_ids, freqs
+
+    @staticmethod
+    def _rows_to_csr(rows: List[Tuple[np.ndarray, np.ndarray]], n_terms: int) -> sp.csr_matrix:
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(term_ids) for term_ids, _ in rows])
+        indices = np.concatenate([term_ids for term_ids, _ in rows]) if rows else np.zeros(0, dtype=np.int32)
+        data = np.concatenate([freqs for _, freqs in rows]) if rows else np.zeros(0, dtype=np.float32)
+        return sp.csr_matrix((data, indices, indptr), shape=(len(rows), n_terms))
+
+    @staticmethod
+    def _with_columns(matrix: sp.csr_matrix, n_terms: int) -> sp.csr_matrix:
+        # Nuovo oggetto che condivide gli array: le matrici non vengono mai modificate in place
+        return sp.csr_matrix((matrix.data, matrix.indices, matrix.indptr), shape=(matrix.shape[0], n_terms))
+
+    def _bm25_weights(self, tf: sp.csr_matrix, doc_len: np.ndarray, avg_len: float) -> sp.csc_matrix:
+        """Pesi BM25 senza IDF (CSC, per estrarre velocemente le colonne della query)."""
+        norm = self.k1 * (1 - self.b + self.b * doc_len / max(avg_len, 1e-6))
+        norm_per_entry = np.repeat(norm, np.diff(tf.indptr))
+        data = (tf.data * (self.k1 + 1) / (tf.data + norm_per_entry)).astype(np.float32)
+        return sp.csr_matrix((data, tf.indices, tf.indptr), shape=tf.shape).tocsc()
+
+    def _current_avg_len(self) -> float:
+        alive_len = self._doc_len[self._alive]
+        return float(alive_len.mean()) if len(alive_len) else 1.0
+
+    def _row_terms(self, row: int) -> np.ndarray:
+        n_base = self._base_tf.shape[0]
+        if row >= n_base:
+            return self._pending[row - n_base][0]
+        return self._base_tf.indices[self._base_tf.indptr[row]:self._base_tf.indptr[row + 1]]
+
+    def _append(self, cv_id: str, profile: Dict[str, Any]):
+        term_ids, freqs = self._encode(self._vocab, self._profile_tokens(profile))
+        if len(self._df) < len(self._vocab):
+            self._df = np.concatenate([self._df, np.zeros(len(self._vocab) - len(self._df), dtype=np.int64)])
+        self._df[term_ids] += 1
+
+        self._row_of[cv_id] = len(self._ids)
+        self._ids.append(cv_id)
+        self._alive = np.append(self._alive, True)
+        self._doc_len = np.append(self._doc_len, np.float32(freqs.sum()))
+        self._pending.append((term_ids, freqs))
+        self._delta_weights = None
+
+    def _drop(self, cv_id: str) -> bool:
+        row = self._row_of.pop(cv_id, None)
+        if row is None:
+            return False
+        self._df[self._row_terms(row)] -= 1
+        self._alive[row] = False
+        return True
+
+    def _compact(self):
+        """Elimina fisicamente le righe cancellate quando diventano troppe (fonde anche il delta)."""
+        dead = len(self._alive) - int(self._alive.sum())
+        if dead < 1000 or dead < self.COMPACT_RATIO * len(self._alive):
+            return
+        n_terms = len(self._vocab)
+        tf = sp.vstack([
+            self._with_columns(self._base_tf, n_terms),
+            self._rows_to_csr(self._pending, n_terms),
+        ], format='csr')
+        keep = np.flatnonzero(self._alive)
+        self._base_tf = tf[keep]
+        self._doc_len = self._doc_len[keep]
+        self._ids = [self._ids[row] for row in keep]
+        self._row_of = {cv_id: row for row, cv_id in enumerate(self._ids)}
+        self._alive = np.ones(len(keep), dtype=bool)
+        self._avg_len = self._current_avg_len()
+        self._base_weights = self._bm25_weights(self._base_tf, self._doc_len, self._avg_len)
+        self._pending = []
+        self._delta_weights = None
+        # Le righe sono state rinumerate: una fusione in corso non e' piu' valida
+        self._generation += 1
+
+    def _build_state(self, profiles: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Costruisce tutte le strutture dell'indice senza toccare quelle in uso."""
+        state = self._empty_state()
+        vocab, ids, row_of, rows, doc_len = state['_vocab'], state['_ids'], state['_row_of'], [], []
+        for profile in profiles:
+            if profile.get('id') is None:
+                continue
+            term_ids, freqs = self._encode(vocab, self._profile_tokens(profile))
+            row_of[str(profile['id'])] = len(ids)
+            ids.append(str(profile['id']))
+            rows.append((term_ids, freqs))
+            doc_len.append(freqs.sum())
+
+        tf = self._rows_to_csr(rows, len(vocab))
+        state['_alive'] = np.ones(len(ids), dtype=bool)
+        state['_doc_len'] = np.asarray(doc_len, dtype=np.float32)
+        state['_df'] = np.bincount(tf.indices, minlength=len(vocab)).astype(np.int64)
+        state['_base_tf'] = tf
+        state['_avg_len'] = float(state['_doc_len'].mean()) if len(ids) else 1.0
+        state['_base_weights'] = self._bm25_weights(tf, state['_doc_len'], state['_avg_len'])
+        return state
+
+    def load(self, profiles: List[Dict[str, Any]], generation: Optional[int] = None):
+        """
+        Ricostruisce l'indice a partire dalle righe di cv_profiles. La costruzione
+        avviene fuori dal lock; le scritture arrivate nel frattempo vengono riapplicate.
+        Se l'indice e' stato invalidato dopo la lettura delle righe, il risultato e' scartato.
+        """
+        state = self._build_state(profiles)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                self._backlog = None
+                return
+            self.__dict__.update(state)
+            self._generation += 1
+            self._loaded = True
+            for op, value in self._backlog or []:
+                if op == 'upsert':
+                    self._upsert_locked(value)
+                else:
+                    self._remove_locked(value)
+            self._backlog = None
+        logger.info(f"Indice di ricerca costruito: {len(state['_ids'])} CV, {len(state['_vocab'])} termini")
+
+    def ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            with self._lock:
+                generation = self._generation
+                self._backlog = []
+            columns = ','.join(('id',) + self.TEXT_FIELDS + self.SKILL_FIELDS)
+            self.load(fetch_all_rows('cv_profiles', columns), generation)
+
+    def invalidate(self):
+        """Scarta l'indice: verra' ricostruito dal database alla prossima ricerca."""
+        with self._lock:
+            self._loaded = False
+            self._backlog = None
+            self._generation += 1
+            self._reset()
+
+    def _upsert_locked(self, profile: Dict[str, Any]):
+        cv_id = str(profile['id'])
+        if self._drop(cv_id):
+            self._compact()
+        self._append(cv_id, profile)
+
+    def _remove_locked(self, cv_id: str):
+        if self._drop(cv_id):
+            self._compact()
+
+    def upsert(self, profile: Dict[str, Any]):
+        """Aggiunge o sostituisce un CV; se l'indice non e' ancora stato costruito non fa nulla."""
+        if not profile or profile.get('id') is None:
+            return
+        with self._lock:
+            if self._loaded:
+                self._upsert_locked(profile)
+                self._maybe_merge()
+            elif self._backlog is not None:
+                self._backlog.append(('upsert', profile))
+
+    def remove(self, cv_id: str):
+        with self._lock:
+            if self._loaded:
+                self._remove_locked(str(cv_id))
+            elif self._backlog is not None:
+                self._backlog.append(('remove', str(cv_id)))
+
+    def _maybe_merge(self):
+        if self._merging or len(self._pending) < self.MERGE_ROWS:
+            return
+        self._merging = True
+        threading.Thread(target=self._merge, name='cv-search-merge', daemon=True).start()
+
+    def _merge(self):
+        """Fonde il delta nella base: il calcolo avviene fuori dal lock, lo scambio sotto lock."""
+        try:
+            with self._lock:
+                generation = self._generation
+                base_tf = self._base_tf
+                merged_rows = list(self._pending)
+                n_terms = len(self._vocab)
+                n_rows = base_tf.shape[0] + len(merged_rows)
+                doc_len = self._doc_len[:n_rows].copy()
+                avg_len = self._current_avg_len()
+
+            tf = sp.vstack([
+                self._with_columns(base_tf, n_terms),
+                self._rows_to_csr(merged_rows, n_terms),
+            ], format='csr')
+            weights = self._bm25_weights(tf, doc_len, avg_len)
+
+            with self._lock:
+                if generation == self._generation:
+                    self._base_tf = tf
+                    self._base_weights = weights
+                    self._avg_len = avg_len
+                    self._pending = self._pending[len(merged_rows):]
+                    self._delta_weights = None
+        except Exception as e:
+            logger.error(f"Errore durante la fusione dell'indice di ricerca: {str(e)}")
+        finally:
+            self._merging = False
+
+    def _delta(self) -> sp.csc_matrix:
+        """Pesi delle sole righe aggiunte dopo l'ultima ricostruzione (con la lunghezza media della base)."""
+        if self._delta_weights is None:
+            n_base = self._base_tf.shape[0]
+            tf = self._rows_to_csr(self._pending, len(self._vocab))
+            self._delta_weights = self._bm25_weights(tf, self._doc_len[n_base:], self._avg_len)
+        return self._delta_weights
+
+    def search(self, query: str, top_k: int = 20) -> List[Tuple[str, float]]:
+        """Restituisce fino a top_k coppie (id CV, punteggio) in ordine di rilevanza."""
+        self.ensure_loaded()
+        with self._lock:
+            term_ids = sorted({self._vocab[t] for t in self.tokenize(query) if t in self._vocab})
+            if not term_ids or not len(self._ids):
+                return []
+
+            cols = np.asarray(term_ids, dtype=np.int64)
+            n_docs = int(self._alive.sum())
+            df = self._df[cols].astype(np.float64)
+            idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+            # I termini nati dopo l'ultima ricostruzione non hanno colonna nella base
+            in_base = cols < self._base_weights.shape[1]
+            scores = np.concatenate([
+                self._base_weights[:, cols[in_base]] @ idf[in_base],
+                self._delta()[:, cols] @ idf,
+            ])
+            scores[~self._alive] = 0
+
+            candidates = np.flatnonzero(scores > 0)
+            if not len(candidates):
+                return []
+            k = min(top_k, len(candidates))
+            top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            top = top[np.argsort(-scores[top], kind='stable')]
+            return [(self._ids[row], round(float(scores[row]), 4)) for row in top]
+
+
+# Create a singleton instance
+cv_search_index = CVSearchIndex()
@@ -0,0 +1,89 @@
+import re
+import json
+from typing import List, Tuple, Any, Optional
+
+KEY_PATTERN = re.compile(r'^\s*"((?:[^"\\]|\\.)*)"\s*:')
+TRAILING_COMMA = re.compile(r',\s*([\]}])')
+
+
+class JSONFieldError(ValueError):
+    """Un membro dell'oggetto JSON non e' decodificabile nemmeno dopo la riparazione."""
+
+    def __init__(self, key: Optional[str], raw: str):
+        super().__init__(f"Valore JSON non valido per il campo {key!r}: {raw[:80]}")
+        self.key = key
+        self.raw = raw
+
+
+class IncrementalJSONObjectParser:
+    """
+    Parser incrementale per un singolo oggetto JSON ricevuto a pezzi (streaming).
+
+    feed() riceve i frammenti di testo man mano che arrivano e restituisce le coppie
+    chiave/valore di primo livello appena sono complete, cosi' ogni campo puo' essere
+    validato mentre il modello sta ancora generando i successivi. Il testo prima della
+    prima '{' (es. un blocco ```json) viene ignorato.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self.complete = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member: List[str] = []
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Consuma un frammento e restituisce i membri completati come (chiave, valore).
+        I membri non decodificabili sono restituiti come (chiave, JSONFieldError).
+        """
+        self.text += chunk
+        completed = []
+        for char in chunk:
+            if self.complete:
+                break
+            if self._depth == 0:
+                if char == '{':
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                self._member.append(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in '[{':
+                self._depth += 1
+            elif char in ']}':
+                self._depth -= 1
+                if self._depth == 0:
+                    completed.extend(self._close_member())
+                    self.complete = True
+                    continue
+            elif char == ',' and self._depth == 1:
+                completed.extend(self._close_member())
+                continue
+            self._member.append(char)
+        return completed
+
+    def _close_member(self) -> List[Tuple[str, Any]]:
+        raw = ''.join(self._member).strip()
+        self._member = []
+        if not raw:
+            return []
+        for candidate in (raw, TRAILING_COMMA.sub(r'\1', raw)):
+            try:
+                return list(json.loads('{' + candidate + '}').items())
+            except json.JSONDecodeError:
+                continue
+        match = KEY_PATTERN.match(raw)
+        key = json.loads(f'"{match.group(1)}"') if match else None
+        return [(key, JSONFieldError(key, raw))]
@@ -1,7 +1,10 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.api import cv
+from app.core.admission import admission_controller, admission_control
+from app.core.shared_cache import shared_cache
 import logging
 
 # Configure logging
@@ -16,6 +19,12 @@ async def startup_event():
     logger.info(f"SUPABASE_URL exists: {bool(settings.SUPABASE_URL)}")
     logger.info(f"SUPABASE_KEY exists: {bool(settings.SUPABASE_KEY)}")
     logger.info(f"GEMINI_API_KEY exists: {bool(settings.GEMINI_API_KEY)}")
+    # Verifica subito la directory della cache condivisa: meglio non partire che servire voci altrui
+    shared_cache.version()
+
+# Controllo di ammissione prima della lettura del corpo (registrato prima di CORS,
+# cosi' anche le risposte 429/503 hanno gli header CORS)
+app.middleware("http")(admission_control)
 
 # Configurazione CORS
 app.add_middleware(
@@ -24,6 +33,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],  # Necessario al frontend per inviare If-Match
 )
 
 # Includi i router
@@ -31,4 +41,10 @@ app.include_router(cv.router)
 
 @app.get("/")
 async def root():
-    return {"message": "CV Parser API"} 
\ No newline at end of file
+    return {"message": "CV Parser API"} 
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Metriche del worker corrente (code e richieste scartate dal controllo di ammissione):
+    # con piu' worker ogni processo risponde con le proprie, distinte dall'etichetta pid
+    return admission_controller.metrics()
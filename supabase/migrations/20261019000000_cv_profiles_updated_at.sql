@@ -0,0 +1,19 @@
+-- Versione compatta della riga per gli aggiornamenti condizionati (If-Match) di PUT/PATCH /cv/{id}
+alter table public.cv_profiles
+    add column if not exists updated_at timestamptz not null default clock_timestamp();
+
+create or replace function public.cv_profiles_set_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    -- clock_timestamp(): valori distinti anche per piu' modifiche nella stessa transazione
+    new.updated_at := clock_timestamp();
+    return new;
+end;
+$$;
+
+drop trigger if exists cv_profiles_set_updated_at on public.cv_profiles;
+create trigger cv_profiles_set_updated_at
+    before update on public.cv_profiles
+    for each row execute function public.cv_profiles_set_updated_at();